@@ -58,6 +58,14 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", "credit_pass"),
         "HOST": os.getenv("POSTGRES_HOST", "db"),
         "PORT": os.getenv("POSTGRES_PORT", "5432"),
+        # Persistent connections help the Celery workers and any real WSGI server;
+        # runserver (entrypoint.sh) still closes connections after every request.
+        "CONN_MAX_AGE": int(os.getenv("POSTGRES_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
+        # Required when connecting through pgbouncer in transaction pooling mode.
+        "DISABLE_SERVER_SIDE_CURSORS": (
+            os.getenv("POSTGRES_DISABLE_SERVER_SIDE_CURSORS", "0") == "1"
+        ),
     }
 }
 
@@ -72,7 +80,18 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_URL", "redis://redis:6379/1"),
+    }
+}
+
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
+CELERY_TASK_ROUTES = {
+    "credit.tasks.ingest_initial_data": {"queue": "ingest"},
+    "credit.tasks.ingest_loan_chunk": {"queue": "ingest"},
+}
 
 DATA_DIR = Path(os.getenv("DATA_DIR", BASE_DIR / "data"))
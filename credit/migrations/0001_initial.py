@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-15 21:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('customer_id', models.AutoField(primary_key=True, serialize=False)),
+                ('first_name', models.CharField(max_length=100)),
+                ('last_name', models.CharField(max_length=100)),
+                ('phone_number', models.CharField(max_length=20)),
+                ('age', models.IntegerField(blank=True, null=True)),
+                ('monthly_salary', models.IntegerField()),
+                ('approved_limit', models.IntegerField()),
+                ('current_debt', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Loan',
+            fields=[
+                ('loan_id', models.AutoField(primary_key=True, serialize=False)),
+                ('loan_amount', models.FloatField()),
+                ('tenure', models.IntegerField()),
+                ('interest_rate', models.FloatField()),
+                ('monthly_repayment', models.FloatField()),
+                ('emis_paid_on_time', models.IntegerField(default=0)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='credit.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'end_date'], name='credit_loan_custome_89ff2f_idx'), models.Index(fields=['customer', 'start_date'], name='credit_loan_custome_d66dab_idx')],
+            },
+        ),
+    ]
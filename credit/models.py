@@ -27,5 +27,11 @@ class Loan(models.Model):
     end_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["customer", "end_date"]),
+            models.Index(fields=["customer", "start_date"]),
+        ]
+
     def __str__(self):
         return f"Loan {self.loan_id} for {self.customer.customer_id}"
@@ -1,11 +1,23 @@
+import math
 from datetime import date
 
-from django.db.models import Q, Sum
+from django.core.cache import cache
+from django.db.models import (
+    Count,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Cast, Coalesce, Floor
 
-from .models import Loan
+from .models import Customer, Loan
 
 
 LAKH = 100000
+CREDIT_SCORE_CACHE_TIMEOUT = 30
 
 
 def round_to_lakh(value):
@@ -16,20 +28,36 @@ def calculate_emi(principal, annual_rate, tenure_months):
     if tenure_months <= 0:
         return 0.0
     monthly_rate = (annual_rate / 100.0) / 12.0
-    if monthly_rate == 0:
+    if abs(monthly_rate) < 1e-12:
         return principal / tenure_months
-    factor = (1 + monthly_rate) ** tenure_months
+    factor = math.exp(tenure_months * math.log1p(monthly_rate))
     return principal * monthly_rate * factor / (factor - 1)
 
 
-def get_current_loans(customer):
+def _current_loans_q():
     today = date.today()
-    return Loan.objects.filter(
-        customer=customer
-    ).filter(Q(end_date__isnull=True) | Q(end_date__gte=today))
+    return Q(end_date__isnull=True) | Q(end_date__gte=today)
+
+
+def get_current_loans(customer):
+    return Loan.objects.filter(customer=customer).filter(_current_loans_q())
+
+
+def customers_with_active_loans():
+    """Customer queryset with current loans prefetched onto ``active_loans``."""
+    return Customer.objects.prefetch_related(
+        Prefetch(
+            "loans",
+            queryset=Loan.objects.filter(_current_loans_q()),
+            to_attr="active_loans",
+        )
+    )
 
 
 def get_current_emi_sum(customer):
+    active_loans = getattr(customer, "active_loans", None)
+    if active_loans is not None:
+        return sum((loan.monthly_repayment for loan in active_loans), 0.0)
     return (
         get_current_loans(customer).aggregate(total=Sum("monthly_repayment")).get("total")
         or 0.0
@@ -37,33 +65,65 @@ def get_current_emi_sum(customer):
 
 
 def get_current_debt_sum(customer):
+    active_loans = getattr(customer, "active_loans", None)
+    if active_loans is not None:
+        return sum((loan.loan_amount for loan in active_loans), 0.0)
     return (
         get_current_loans(customer).aggregate(total=Sum("loan_amount")).get("total")
         or 0.0
     )
 
 
+def refresh_current_debts(customers=None):
+    """Recompute ``current_debt`` for ``customers`` in a single UPDATE statement."""
+    if customers is None:
+        customers = Customer.objects.all()
+    debt = (
+        Loan.objects.filter(customer=OuterRef("pk"))
+        .filter(_current_loans_q())
+        .values("customer")
+        .annotate(total=Sum("loan_amount"))
+        .values("total")
+    )
+    return customers.update(
+        current_debt=Cast(Floor(Coalesce(Subquery(debt), 0.0)), IntegerField())
+    )
+
+
+def credit_score_cache_key(customer_id):
+    return f"credit_score:{customer_id}"
+
+
 def compute_credit_score(customer):
-    loans = Loan.objects.filter(customer=customer)
-    total_loans = loans.count()
-    current_debt = get_current_debt_sum(customer)
+    return cache.get_or_set(
+        credit_score_cache_key(customer.customer_id),
+        lambda: _compute_credit_score(customer),
+        timeout=CREDIT_SCORE_CACHE_TIMEOUT,
+    )
 
-    if current_debt > customer.approved_limit:
-        return 0
 
-    total_emis = loans.aggregate(total=Sum("tenure")).get("total") or 0
-    paid_on_time = loans.aggregate(total=Sum("emis_paid_on_time")).get("total") or 0
-    on_time_ratio = min(paid_on_time / total_emis, 1) if total_emis > 0 else 0
+def _compute_credit_score(customer):
+    today = date.today()
+    agg = Loan.objects.filter(customer=customer).aggregate(
+        total_loans=Count("pk"),
+        current_debt=Coalesce(Sum("loan_amount", filter=_current_loans_q()), 0.0),
+        total_emis=Coalesce(Sum("tenure"), 0),
+        paid_on_time=Coalesce(Sum("emis_paid_on_time"), 0),
+        current_year_loans=Count("pk", filter=Q(start_date__year=today.year)),
+        total_volume=Coalesce(Sum("loan_amount"), 0.0),
+    )
+
+    if agg["current_debt"] > customer.approved_limit:
+        return 0
 
-    loan_count_score = min(total_loans, 10) / 10 * 15
+    total_emis = agg["total_emis"]
+    on_time_ratio = min(agg["paid_on_time"] / total_emis, 1) if total_emis > 0 else 0
 
-    current_year = date.today().year
-    current_year_loans = loans.filter(start_date__year=current_year).count()
-    current_year_score = min(current_year_loans, 5) / 5 * 15
+    loan_count_score = min(agg["total_loans"], 10) / 10 * 15
+    current_year_score = min(agg["current_year_loans"], 5) / 5 * 15
 
     approved_limit = customer.approved_limit or 1
-    total_volume = loans.aggregate(total=Sum("loan_amount")).get("total") or 0
-    volume_score = min(total_volume / approved_limit, 1) * 20
+    volume_score = min(agg["total_volume"] / approved_limit, 1) * 20
 
     score = on_time_ratio * 50 + loan_count_score + current_year_score + volume_score
     return min(int(score), 100)
@@ -89,6 +149,7 @@ def evaluate_eligibility(customer, loan_amount, interest_rate, tenure):
             "score": score,
             "approved": False,
             "corrected_rate": interest_rate,
+            "monthly_installment": calculate_emi(loan_amount, interest_rate, tenure),
         }
 
     if min_rate > 0 and interest_rate < min_rate:
@@ -98,22 +159,9 @@ def evaluate_eligibility(customer, loan_amount, interest_rate, tenure):
     new_emi = calculate_emi(loan_amount, corrected_rate, tenure)
     emi_limit = 0.5 * customer.monthly_salary
 
-    if current_emi_sum + new_emi > emi_limit:
-        return {
-            "score": score,
-            "approved": False,
-            "corrected_rate": corrected_rate,
-        }
-
-    if min_rate > 0 and interest_rate < min_rate:
-        return {
-            "score": score,
-            "approved": False,
-            "corrected_rate": corrected_rate,
-        }
-
     return {
         "score": score,
-        "approved": True,
+        "approved": current_emi_sum + new_emi <= emi_limit,
         "corrected_rate": corrected_rate,
+        "monthly_installment": new_emi,
     }
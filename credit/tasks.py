@@ -1,87 +1,173 @@
-from datetime import date
-
+import numpy as np
 import pandas as pd
-from celery import shared_task
+from celery import group, shared_task
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection
 
 from .models import Customer, Loan
-from .services import calculate_emi, get_current_debt_sum
+from .services import refresh_current_debts
+
+
+BULK_BATCH_SIZE = 5000
+LOAN_CHUNK_SIZE = 10000
+
+CUSTOMER_UPDATE_FIELDS = [
+    "first_name",
+    "last_name",
+    "phone_number",
+    "age",
+    "monthly_salary",
+    "approved_limit",
+]
+
+LOAN_UPDATE_FIELDS = [
+    "customer",
+    "loan_amount",
+    "tenure",
+    "interest_rate",
+    "monthly_repayment",
+    "emis_paid_on_time",
+    "start_date",
+    "end_date",
+]
+
+
+# Source sheets use different headers for some model fields.
+LOAN_COLUMN_ALIASES = {
+    "monthly_payment": "monthly_repayment",
+    "date_of_approval": "start_date",
+}
+
+
+def _read_sheet(path, aliases=None):
+    df = pd.read_excel(path, engine="calamine")
+    df = df.rename(columns=lambda column: str(column).strip().lower().replace(" ", "_"))
+    return df.rename(columns=aliases or {})
+
+
+def _column(df, name, default):
+    if name in df:
+        return df[name].fillna(default)
+    return pd.Series(default, index=df.index)
+
 
+def _date_column(df, name):
+    # ISO strings keep loan chunks JSON-serializable for the Celery broker.
+    if name in df:
+        dates = pd.to_datetime(df[name], errors="coerce")
+    else:
+        dates = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    return dates.dt.strftime("%Y-%m-%d").astype(object).where(dates.notna(), None)
 
-def _parse_date(value):
-    if pd.isna(value):
-        return None
-    if isinstance(value, date):
-        return value
-    return pd.to_datetime(value).date()
 
+def _reset_sequences(*models):
+    # Rows are upserted with explicit ids, which Postgres sequences do not track.
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
 
-def _get_value(row, *keys, default=None):
-    for key in keys:
-        if key in row and not pd.isna(row.get(key)):
-            return row.get(key)
-    return default
 
+def _calculate_emis(principal, annual_rate, tenure_months):
+    """Vectorized ``calculate_emi`` over NumPy arrays of loans."""
+    monthly_rate = annual_rate / 1200.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = np.exp(tenure_months * np.log1p(monthly_rate))
+        emi = principal * monthly_rate * factor / (factor - 1)
+    return np.where(np.abs(monthly_rate) < 1e-12, principal / tenure_months, emi)
 
-@shared_task
+
+def _prepare_customers(df):
+    df = df.dropna(subset=["customer_id"]).copy()
+    df["customer_id"] = df["customer_id"].astype(int)
+    df = df.drop_duplicates(subset="customer_id", keep="last")
+    for name in ("first_name", "last_name", "phone_number"):
+        df[name] = _column(df, name, "").astype(str).str.strip()
+    ages = pd.to_numeric(_column(df, "age", np.nan), errors="coerce").astype("Int64")
+    df["age"] = ages.astype(object).where(ages.notna(), None)
+    for name in ("monthly_salary", "approved_limit"):
+        df[name] = _column(df, name, 0).astype(int)
+    return df[["customer_id", *CUSTOMER_UPDATE_FIELDS]]
+
+
+def _prepare_loans(df):
+    df = df.dropna(subset=["customer_id", "loan_id"]).copy()
+    df["customer_id"] = df["customer_id"].astype(int)
+    df["loan_id"] = df["loan_id"].astype(int)
+    # The sheet repeats some loan ids; keep the last row like update_or_create did.
+    df = df.drop_duplicates(subset="loan_id", keep="last")
+
+    for name in ("loan_amount", "interest_rate", "monthly_repayment"):
+        df[name] = _column(df, name, 0).astype(float)
+    for name in ("tenure", "emis_paid_on_time"):
+        df[name] = _column(df, name, 0).astype(int)
+    for name in ("start_date", "end_date"):
+        df[name] = _date_column(df, name)
+
+    missing_emi = (
+        (df["monthly_repayment"] == 0) & (df["loan_amount"] != 0) & (df["tenure"] > 0)
+    )
+    if missing_emi.any():
+        df.loc[missing_emi, "monthly_repayment"] = _calculate_emis(
+            df.loc[missing_emi, "loan_amount"].to_numpy(),
+            df.loc[missing_emi, "interest_rate"].to_numpy(),
+            df.loc[missing_emi, "tenure"].to_numpy(),
+        )
+
+    fields = [name for name in LOAN_UPDATE_FIELDS if name != "customer"]
+    return df[["loan_id", "customer_id", *fields]]
+
+
+@shared_task(queue="ingest", acks_late=True, time_limit=3600)
 def ingest_initial_data():
     customer_file = settings.DATA_DIR / "customer_data.xlsx"
     loan_file = settings.DATA_DIR / "loan_data.xlsx"
 
     if customer_file.exists():
-        customers_df = pd.read_excel(customer_file)
-        for _, row in customers_df.iterrows():
-            customer_id_value = _get_value(row, "customer_id", "customer id")
-            if customer_id_value is None:
-                continue
-            Customer.objects.update_or_create(
-                customer_id=int(customer_id_value),
-                defaults={
-                    "first_name": str(_get_value(row, "first_name", default="")).strip(),
-                    "last_name": str(_get_value(row, "last_name", default="")).strip(),
-                    "phone_number": str(_get_value(row, "phone_number", default="")).strip(),
-                    "monthly_salary": int(_get_value(row, "monthly_salary", default=0)),
-                    "approved_limit": int(_get_value(row, "approved_limit", default=0)),
-                    "current_debt": int(_get_value(row, "current_debt", default=0)),
-                },
-            )
+        customers_df = _prepare_customers(_read_sheet(customer_file))
+        Customer.objects.bulk_create(
+            [Customer(**row) for row in customers_df.to_dict("records")],
+            batch_size=BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["customer_id"],
+            update_fields=CUSTOMER_UPDATE_FIELDS,
+        )
+        _reset_sequences(Customer)
+        # Names and approved limits feed cached payloads and credit scores.
+        cache.clear()
 
     if loan_file.exists():
-        loans_df = pd.read_excel(loan_file)
-        for _, row in loans_df.iterrows():
-            customer_id_value = _get_value(row, "customer id", "customer_id")
-            if customer_id_value is None:
-                continue
-            customer_id = int(customer_id_value)
-            customer = Customer.objects.filter(customer_id=customer_id).first()
-            if not customer:
-                continue
-
-            interest_rate = float(_get_value(row, "interest rate", "interest_rate", default=0))
-            tenure = int(_get_value(row, "tenure", default=0))
-            loan_amount = float(_get_value(row, "loan amount", "loan_amount", default=0))
-            monthly_repayment = float(
-                _get_value(row, "monthly repayment", "monthly_repayment", default=0)
-            )
-            if monthly_repayment == 0 and loan_amount and tenure:
-                monthly_repayment = calculate_emi(loan_amount, interest_rate, tenure)
-
-            Loan.objects.update_or_create(
-                loan_id=int(_get_value(row, "loan id", "loan_id")),
-                defaults={
-                    "customer": customer,
-                    "loan_amount": loan_amount,
-                    "tenure": tenure,
-                    "interest_rate": interest_rate,
-                    "monthly_repayment": monthly_repayment,
-                    "emis_paid_on_time": int(
-                        _get_value(row, "EMIs paid on time", "emis_paid_on_time", default=0)
-                    ),
-                    "start_date": _parse_date(_get_value(row, "start date", "start_date")),
-                    "end_date": _parse_date(_get_value(row, "end date", "end_date")),
-                },
-            )
-
-    for customer in Customer.objects.all():
-        customer.current_debt = int(get_current_debt_sum(customer))
-        customer.save(update_fields=["current_debt"])
+        loans_df = _prepare_loans(_read_sheet(loan_file, LOAN_COLUMN_ALIASES))
+        records = loans_df.to_dict("records")
+        chunks = [
+            records[start:start + LOAN_CHUNK_SIZE]
+            for start in range(0, len(records), LOAN_CHUNK_SIZE)
+        ]
+        group(ingest_loan_chunk.s(chunk) for chunk in chunks).apply_async()
+
+
+@shared_task(queue="ingest", acks_late=True)
+def ingest_loan_chunk(records):
+    customer_ids = {row["customer_id"] for row in records}
+    customers = Customer.objects.only("customer_id").in_bulk(customer_ids)
+    loans = [
+        Loan(customer=customers[row.pop("customer_id")], **row)
+        for row in records
+        if row["customer_id"] in customers
+    ]
+    Loan.objects.bulk_create(
+        loans,
+        batch_size=BULK_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["loan_id"],
+        update_fields=LOAN_UPDATE_FIELDS,
+    )
+
+    # Each chunk leaves the tables consistent on its own, so a failed sibling
+    # chunk cannot strand the id sequence, debts or cache.
+    _reset_sequences(Loan)
+    refresh_current_debts(Customer.objects.filter(pk__in=customers))
+    cache.clear()
+    return len(loans)
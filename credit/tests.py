@@ -1,23 +1,48 @@
 from datetime import date, timedelta
+from unittest import mock
 
-from django.test import TestCase
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from core.celery import app as celery_app
+
 from .models import Customer, Loan
+from .tasks import (
+    _calculate_emis,
+    _date_column,
+    _prepare_customers,
+    ingest_initial_data,
+    ingest_loan_chunk,
+)
 from .services import (
+    _compute_credit_score,
     calculate_emi,
     round_to_lakh,
     compute_credit_score,
     minimum_rate_for_score,
     evaluate_eligibility,
     get_current_debt_sum,
+    get_current_loans,
+    refresh_current_debts,
 )
 
 
+# Keep tests off the app's Redis cache; setUp methods clear the test cache.
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=TEST_CACHES)
 class ServiceTests(TestCase):
     """Tests for credit service functions."""
 
+    def setUp(self):
+        cache.clear()
+
     def test_round_to_lakh(self):
         self.assertEqual(round_to_lakh(150000), 200000)
         self.assertEqual(round_to_lakh(149999), 100000)
@@ -75,6 +100,40 @@ class ServiceTests(TestCase):
         score = compute_credit_score(customer)
         self.assertGreater(score, 0)
 
+    def test_compute_credit_score_single_query(self):
+        customer = Customer.objects.create(
+            first_name="Test",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=50000,
+            approved_limit=1800000,
+        )
+        Loan.objects.create(
+            customer=customer,
+            loan_amount=100000,
+            tenure=12,
+            interest_rate=12,
+            monthly_repayment=8885,
+            emis_paid_on_time=12,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=365),
+        )
+        with self.assertNumQueries(1):
+            score = compute_credit_score(customer)
+        self.assertGreater(score, 0)
+
+    def test_compute_credit_score_cached(self):
+        customer = Customer.objects.create(
+            first_name="Test",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=50000,
+            approved_limit=1800000,
+        )
+        score = compute_credit_score(customer)
+        with self.assertNumQueries(0):
+            self.assertEqual(compute_credit_score(customer), score)
+
     def test_evaluate_eligibility_approved(self):
         customer = Customer.objects.create(
             first_name="Test",
@@ -97,8 +156,69 @@ class ServiceTests(TestCase):
         result = evaluate_eligibility(customer, 200000, 12, 24)
         self.assertIn("approved", result)
         self.assertIn("score", result)
+        self.assertAlmostEqual(
+            result["monthly_installment"],
+            calculate_emi(200000, result["corrected_rate"], 24),
+        )
 
+    def test_evaluate_eligibility_corrects_low_rate(self):
+        customer = Customer.objects.create(
+            first_name="Test",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=100000,
+            approved_limit=3600000,
+        )
+        with mock.patch("credit.services.compute_credit_score", return_value=40):
+            result = evaluate_eligibility(customer, 200000, 8, 24)
+        self.assertTrue(result["approved"])
+        self.assertEqual(result["corrected_rate"], 12.0)
+        self.assertAlmostEqual(result["monthly_installment"], calculate_emi(200000, 12, 24))
 
+    def test_refresh_current_debts(self):
+        customer = Customer.objects.create(
+            first_name="Test",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=999,
+        )
+        idle = Customer.objects.create(
+            first_name="Idle",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=999,
+        )
+        Loan.objects.create(
+            customer=customer,
+            loan_amount=100000.75,
+            tenure=12,
+            interest_rate=12,
+            monthly_repayment=8885,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=365),
+        )
+        Loan.objects.create(
+            customer=customer,
+            loan_amount=50000,
+            tenure=12,
+            interest_rate=12,
+            monthly_repayment=4442,
+            start_date=date.today() - timedelta(days=400),
+            end_date=date.today() - timedelta(days=30),
+        )
+        with self.assertNumQueries(1):
+            refresh_current_debts()
+        customer.refresh_from_db()
+        idle.refresh_from_db()
+        self.assertEqual(customer.current_debt, 100000)
+        self.assertEqual(idle.current_debt, 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
 class CustomerAPITests(APITestCase):
     """Tests for customer registration API."""
 
@@ -122,10 +242,12 @@ class CustomerAPITests(APITestCase):
         self.assertIn("error", response.data)
 
 
+@override_settings(CACHES=TEST_CACHES)
 class LoanAPITests(APITestCase):
     """Tests for loan-related APIs."""
 
     def setUp(self):
+        cache.clear()
         self.customer = Customer.objects.create(
             first_name="Jane",
             last_name="Doe",
@@ -153,7 +275,9 @@ class LoanAPITests(APITestCase):
             "interest_rate": 15,
             "tenure": 24,
         }
-        response = self.client.post("/check-eligibility", data, format="json")
+        # Customer, prefetched current loans and the credit score aggregate.
+        with self.assertNumQueries(3):
+            response = self.client.post("/check-eligibility", data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("approval", response.data)
         self.assertIn("monthly_installment", response.data)
@@ -168,6 +292,18 @@ class LoanAPITests(APITestCase):
         response = self.client.post("/check-eligibility", data, format="json")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_negative_interest_rate_rejected(self):
+        data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 200000,
+            "interest_rate": -1500,
+            "tenure": 24,
+        }
+        for url in ("/check-eligibility", "/create-loan"):
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("error", response.data)
+
     def test_create_loan_success(self):
         data = {
             "customer_id": self.customer.customer_id,
@@ -180,6 +316,19 @@ class LoanAPITests(APITestCase):
         self.assertTrue(response.data["loan_approved"])
         self.assertIsNotNone(response.data["loan_id"])
 
+    def test_create_loan_updates_current_debt(self):
+        data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 200000,
+            "interest_rate": 15,
+            "tenure": 24,
+        }
+        response = self.client.post("/create-loan", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.first_name, "Jane")
+        self.assertEqual(self.customer.current_debt, 200000)
+
     def test_view_loan(self):
         loan = Loan.objects.create(
             customer=self.customer,
@@ -190,7 +339,8 @@ class LoanAPITests(APITestCase):
             start_date=date.today(),
             end_date=date.today() + timedelta(days=1080),
         )
-        response = self.client.get(f"/view-loan/{loan.loan_id}")
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/view-loan/{loan.loan_id}")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["loan_id"], loan.loan_id)
         self.assertEqual(response.data["loan_amount"], 300000)
@@ -208,8 +358,203 @@ class LoanAPITests(APITestCase):
         response = self.client.get(f"/view-loans/{self.customer.customer_id}")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsInstance(response.data, list)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["repayments_left"], 18)
+
+    def test_view_loans_by_customer_after_create_loan(self):
+        url = f"/view-loans/{self.customer.customer_id}"
+        self.assertEqual(self.client.get(url).data, [])
+        data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 200000,
+            "interest_rate": 15,
+            "tenure": 24,
+        }
+        loan_id = self.client.post("/create-loan", data, format="json").data["loan_id"]
+        response = self.client.get(url)
+        self.assertEqual([loan["loan_id"] for loan in response.data], [loan_id])
+
+    def test_view_loans_by_customer_not_found(self):
+        response = self.client.get("/view-loans/99999")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_view_loan_not_found(self):
         response = self.client.get("/view-loan/99999")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IngestionTests(TestCase):
+    """Tests for the initial Excel ingestion task."""
+
+    def setUp(self):
+        # Run the loan chunk group inline instead of through the broker.
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", always_eager)
+
+    def test_calculate_emis_matches_calculate_emi(self):
+        principal = np.array([100000.0, 12000.0, 900000.0])
+        annual_rate = np.array([12.0, 0.0, 8.2])
+        tenure = np.array([12, 12, 129])
+        emis = _calculate_emis(principal, annual_rate, tenure)
+        for emi, loan in zip(emis, zip(principal, annual_rate, tenure)):
+            self.assertAlmostEqual(emi, calculate_emi(*loan), places=6)
+
+    def test_date_column_handles_missing_values(self):
+        df = pd.DataFrame({"end_date": [pd.Timestamp("2024-01-31"), pd.NaT, None]})
+        self.assertEqual(_date_column(df, "end_date").tolist(), ["2024-01-31", None, None])
+        self.assertEqual(_date_column(df, "start_date").tolist(), [None, None, None])
+
+    def test_prepare_customers_keeps_last_duplicate_and_age(self):
+        df = pd.DataFrame(
+            {
+                "customer_id": [1, 2, 1],
+                "first_name": ["Old", "Bob", "New"],
+                "age": [30, None, 31],
+                "monthly_salary": [50000, 60000, 55000],
+                "approved_limit": [1800000, 2200000, 2000000],
+            }
+        )
+        records = _prepare_customers(df).to_dict("records")
+        self.assertEqual([row["customer_id"] for row in records], [2, 1])
+        self.assertEqual(records[1]["first_name"], "New")
+        self.assertEqual([row["age"] for row in records], [None, 31])
+
+    def test_ingest_loan_chunk_skips_unknown_customers(self):
+        customer = Customer.objects.create(
+            first_name="Test",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=50000,
+            approved_limit=1800000,
+        )
+        loan = {
+            "loan_amount": 100000.0,
+            "tenure": 12,
+            "interest_rate": 12.0,
+            "monthly_repayment": 8885.0,
+            "emis_paid_on_time": 3,
+            "start_date": "2024-01-01",
+            "end_date": None,
+        }
+        records = [
+            {"loan_id": 1, "customer_id": customer.customer_id, **loan},
+            {"loan_id": 2, "customer_id": customer.customer_id + 1, **loan},
+        ]
+        self.assertEqual(ingest_loan_chunk(records), 1)
+        self.assertEqual(list(Loan.objects.values_list("loan_id", flat=True)), [1])
+        self.assertEqual(Loan.objects.get().start_date, date(2024, 1, 1))
+
+    def test_ingest_loan_chunk_syncs_debt_and_sequence(self):
+        customer = Customer.objects.create(
+            first_name="Test",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=50000,
+            approved_limit=1800000,
+        )
+        record = {
+            "loan_id": 500,
+            "customer_id": customer.customer_id,
+            "loan_amount": 100000.0,
+            "tenure": 12,
+            "interest_rate": 12.0,
+            "monthly_repayment": 8885.0,
+            "emis_paid_on_time": 3,
+            "start_date": "2024-01-01",
+            "end_date": None,
+        }
+        ingest_loan_chunk([record])
+        customer.refresh_from_db()
+        self.assertEqual(customer.current_debt, 100000)
+
+        loan = Loan.objects.create(
+            customer=customer,
+            loan_amount=1000,
+            tenure=12,
+            interest_rate=12,
+            monthly_repayment=89,
+        )
+        self.assertGreater(loan.loan_id, 500)
+
+    def test_ingest_initial_data(self):
+        if not (settings.DATA_DIR / "customer_data.xlsx").exists():
+            self.skipTest("Initial data files are not available.")
+        ingest_initial_data()
+        self.assertEqual(Customer.objects.count(), 300)
+        self.assertTrue(Loan.objects.exists())
+        customer = Customer.objects.get(customer_id=1)
+        self.assertEqual(customer.first_name, "Aaron")
+        self.assertIsNotNone(customer.age)
+        self.assertEqual(customer.current_debt, int(get_current_debt_sum(customer)))
+
+        # Re-running the ingestion upserts instead of duplicating rows.
+        loan_count = Loan.objects.count()
+        ingest_initial_data()
+        self.assertEqual(Customer.objects.count(), 300)
+        self.assertEqual(Loan.objects.count(), loan_count)
+
+    def test_api_creates_rows_after_ingestion(self):
+        if not (settings.DATA_DIR / "customer_data.xlsx").exists():
+            self.skipTest("Initial data files are not available.")
+        ingest_initial_data()
+        cache.clear()
+
+        data = {
+            "first_name": "John",
+            "last_name": "Doe",
+            "age": 30,
+            "monthly_income": 50000,
+            "phone_number": "9876543210",
+        }
+        response = self.client.post("/register", data, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Customer.objects.count(), 301)
+
+        data = {"customer_id": 2, "loan_amount": 100000, "interest_rate": 12, "tenure": 12}
+        loan_count = Loan.objects.count()
+        response = self.client.post("/create-loan", data, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Loan.objects.count(), loan_count + 1)
+
+    def test_loan_views_reflect_ingestion(self):
+        if not (settings.DATA_DIR / "loan_data.xlsx").exists():
+            self.skipTest("Initial data files are not available.")
+        cache.clear()
+        Customer.objects.create(
+            customer_id=14,
+            first_name="Test",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=50000,
+            approved_limit=1800000,
+        )
+        self.assertEqual(self.client.get("/view-loans/14").json(), [])
+
+        ingest_initial_data()
+        response = self.client.get("/view-loans/14")
+        self.assertEqual(
+            sorted(loan["loan_id"] for loan in response.json()),
+            sorted(get_current_loans(14).values_list("loan_id", flat=True)),
+        )
+        self.assertNotEqual(response.json(), [])
+
+    def test_credit_score_reflects_ingestion(self):
+        if not (settings.DATA_DIR / "loan_data.xlsx").exists():
+            self.skipTest("Initial data files are not available.")
+        cache.clear()
+        customer = Customer.objects.create(
+            customer_id=14,
+            first_name="Test",
+            last_name="User",
+            phone_number="1234567890",
+            monthly_salary=50000,
+            approved_limit=1800000,
+        )
+        self.assertEqual(compute_credit_score(customer), 0)
+
+        ingest_initial_data()
+        customer = Customer.objects.get(customer_id=14)
+        self.assertEqual(compute_credit_score(customer), _compute_credit_score(customer))
+        self.assertGreater(compute_credit_score(customer), 0)
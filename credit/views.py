@@ -1,7 +1,8 @@
 from datetime import date
 
 from dateutil.relativedelta import relativedelta
-from django.db.models import Q
+from django.core.cache import cache
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
@@ -9,13 +10,21 @@ from rest_framework import status
 
 from .models import Customer, Loan
 from .services import (
-    calculate_emi,
+    credit_score_cache_key,
+    customers_with_active_loans,
     evaluate_eligibility,
     get_current_debt_sum,
+    get_current_loans,
     round_to_lakh,
 )
 
 
+READ_CACHE_TIMEOUT = 60
+
+# Customer columns read while evaluating and creating loans.
+ELIGIBILITY_CUSTOMER_FIELDS = ("customer_id", "approved_limit", "monthly_salary")
+
+
 def _require_fields(data, fields):
     missing = [field for field in fields if field not in data]
     if missing:
@@ -36,14 +45,17 @@ def _parse_int(value, field):
         )
 
 
-def _parse_float(value, field):
+def _parse_float(value, field, minimum=None):
     try:
-        return float(value), None
+        parsed = float(value)
     except (TypeError, ValueError):
+        parsed = None
+    if parsed is None or (minimum is not None and parsed < minimum):
         return None, Response(
             {"error": f"Invalid value for {field}."},
             status=status.HTTP_400_BAD_REQUEST,
         )
+    return parsed, None
 
 
 @api_view(["POST"])
@@ -93,11 +105,16 @@ def check_eligibility(request):
     if not ok:
         return response
 
-    customer = get_object_or_404(Customer, customer_id=request.data["customer_id"])
+    customer = get_object_or_404(
+        customers_with_active_loans().only(*ELIGIBILITY_CUSTOMER_FIELDS),
+        customer_id=request.data["customer_id"],
+    )
     loan_amount, error = _parse_float(request.data["loan_amount"], "loan_amount")
     if error:
         return error
-    interest_rate, error = _parse_float(request.data["interest_rate"], "interest_rate")
+    interest_rate, error = _parse_float(
+        request.data["interest_rate"], "interest_rate", minimum=0
+    )
     if error:
         return error
     tenure, error = _parse_int(request.data["tenure"], "tenure")
@@ -106,7 +123,7 @@ def check_eligibility(request):
 
     evaluation = evaluate_eligibility(customer, loan_amount, interest_rate, tenure)
     corrected_rate = evaluation["corrected_rate"]
-    monthly_installment = calculate_emi(loan_amount, corrected_rate, tenure)
+    monthly_installment = evaluation["monthly_installment"]
 
     return Response(
         {
@@ -128,11 +145,16 @@ def create_loan(request):
     if not ok:
         return response
 
-    customer = get_object_or_404(Customer, customer_id=request.data["customer_id"])
+    customer = get_object_or_404(
+        customers_with_active_loans().only(*ELIGIBILITY_CUSTOMER_FIELDS),
+        customer_id=request.data["customer_id"],
+    )
     loan_amount, error = _parse_float(request.data["loan_amount"], "loan_amount")
     if error:
         return error
-    interest_rate, error = _parse_float(request.data["interest_rate"], "interest_rate")
+    interest_rate, error = _parse_float(
+        request.data["interest_rate"], "interest_rate", minimum=0
+    )
     if error:
         return error
     tenure, error = _parse_int(request.data["tenure"], "tenure")
@@ -141,7 +163,7 @@ def create_loan(request):
 
     evaluation = evaluate_eligibility(customer, loan_amount, interest_rate, tenure)
     corrected_rate = evaluation["corrected_rate"]
-    monthly_installment = calculate_emi(loan_amount, corrected_rate, tenure)
+    monthly_installment = evaluation["monthly_installment"]
 
     if not evaluation["approved"]:
         return Response(
@@ -167,6 +189,13 @@ def create_loan(request):
         start_date=start_date,
         end_date=end_date,
     )
+    customer.active_loans.append(loan)
+    cache.delete_many(
+        [
+            credit_score_cache_key(customer.customer_id),
+            _customer_loans_cache_key(customer.customer_id),
+        ]
+    )
 
     customer.current_debt = int(get_current_debt_sum(customer))
     customer.save(update_fields=["current_debt"])
@@ -183,47 +212,76 @@ def create_loan(request):
     )
 
 
-@api_view(["GET"])
-def view_loan(request, loan_id):
-    loan = get_object_or_404(Loan, loan_id=loan_id)
-    customer = loan.customer
+def _loan_cache_key(loan_id):
+    return f"loan:{loan_id}"
 
-    return Response(
-        {
-            "loan_id": loan.loan_id,
-            "customer": {
-                "id": customer.customer_id,
-                "first_name": customer.first_name,
-                "last_name": customer.last_name,
-                "phone_number": customer.phone_number,
-                "age": customer.age,
-            },
-            "loan_amount": loan.loan_amount,
-            "interest_rate": loan.interest_rate,
-            "monthly_installment": round(loan.monthly_repayment, 2),
-            "tenure": loan.tenure,
-        }
-    )
 
+def _customer_loans_cache_key(customer_id):
+    return f"loans:{customer_id}"
 
-@api_view(["GET"])
-def view_loans_by_customer(request, customer_id):
-    customer = get_object_or_404(Customer, customer_id=customer_id)
-    loans = Loan.objects.filter(customer=customer).filter(
-        Q(end_date__isnull=True) | Q(end_date__gte=date.today())
+
+def _loan_payload(loan_id):
+    loan = get_object_or_404(Loan.objects.select_related("customer"), loan_id=loan_id)
+    customer = loan.customer
+
+    return {
+        "loan_id": loan.loan_id,
+        "customer": {
+            "id": customer.customer_id,
+            "first_name": customer.first_name,
+            "last_name": customer.last_name,
+            "phone_number": customer.phone_number,
+            "age": customer.age,
+        },
+        "loan_amount": loan.loan_amount,
+        "interest_rate": loan.interest_rate,
+        "monthly_installment": round(loan.monthly_repayment, 2),
+        "tenure": loan.tenure,
+    }
+
+
+def _customer_loans_payload(customer_id):
+    if not Customer.objects.filter(customer_id=customer_id).exists():
+        raise Http404("No Customer matches the given query.")
+    loans = get_current_loans(customer_id).values(
+        "loan_id",
+        "loan_amount",
+        "interest_rate",
+        "monthly_repayment",
+        "tenure",
+        "emis_paid_on_time",
     )
 
-    response = []
+    payload = []
     for loan in loans:
-        repayments_left = max(loan.tenure - loan.emis_paid_on_time, 0)
-        response.append(
+        repayments_left = max(loan["tenure"] - loan["emis_paid_on_time"], 0)
+        payload.append(
             {
-                "loan_id": loan.loan_id,
-                "loan_amount": loan.loan_amount,
-                "interest_rate": loan.interest_rate,
-                "monthly_installment": round(loan.monthly_repayment, 2),
+                "loan_id": loan["loan_id"],
+                "loan_amount": loan["loan_amount"],
+                "interest_rate": loan["interest_rate"],
+                "monthly_installment": round(loan["monthly_repayment"], 2),
                 "repayments_left": repayments_left,
             }
         )
+    return payload
+
 
-    return Response(response)
+@api_view(["GET"])
+def view_loan(request, loan_id):
+    payload = cache.get_or_set(
+        _loan_cache_key(loan_id),
+        lambda: _loan_payload(loan_id),
+        timeout=READ_CACHE_TIMEOUT,
+    )
+    return Response(payload)
+
+
+@api_view(["GET"])
+def view_loans_by_customer(request, customer_id):
+    payload = cache.get_or_set(
+        _customer_loans_cache_key(customer_id),
+        lambda: _customer_loans_payload(customer_id),
+        timeout=READ_CACHE_TIMEOUT,
+    )
+    return Response(payload)